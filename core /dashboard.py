@@ -1,15 +1,23 @@
 import streamlit as st
 import gspread
+import requests
 from google.oauth2.service_account import Credentials
 import pandas as pd
+import numpy as np
+import pyarrow as pa   # ships with streamlit
+from pyarrow import csv as pacsv
 from datetime import datetime, timedelta
 import re
 from urllib.parse import unquote
 import html as html_lib
 import html as _html_esc  # alias used in card builder
 import os
+import io
+import time
+import sqlite3
+import threading
 import base64
-import urllib.parse   # used in geocoding
+import urllib.parse   # quote_plus for promotor search links
 
 # ── Auto-install folium if not present ──────────────────────
 try:
@@ -70,6 +78,20 @@ LOGO_HTML = (
 # Inga adds rows here to grant access. No Streamlit redeploy needed.
 # Fallback: st.secrets["users"] still works for backward compat.
 # ════════════════════════════════════════════════════════════
+@st.cache_resource(show_spinner=False)
+def _open_spreadsheet():
+    """Authorised handle on the PlanningScout spreadsheet, shared by every
+    Sheets call (Users, Activity, Permits). Built once per process instead of
+    re-reading the service account and re-authorising on each call.
+    Raises on failure — callers keep their own try/except."""
+    sa = dict(st.secrets["gcp_service_account"])
+    creds = Credentials.from_service_account_info(sa, scopes=[
+        "https://www.googleapis.com/auth/spreadsheets",
+        "https://www.googleapis.com/auth/drive",
+    ])
+    gc = gspread.authorize(creds)
+    return gc.open_by_key(st.secrets.get("SHEET_ID", ""))
+
 @st.cache_data(ttl=60)
 def load_users_from_sheet():
     """Load users from the 'Users' worksheet.
@@ -79,13 +101,7 @@ def load_users_from_sheet():
     Returns ({}, {}) on any error.
     """
     try:
-        sa = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(sa, scopes=[
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive",
-        ])
-        gc = gspread.authorize(creds)
-        ws = gc.open_by_key(st.secrets.get("SHEET_ID", "")).worksheet("Users")
+        ws = _open_spreadsheet().worksheet("Users")
         rows = ws.get_all_records()
         passwords = {}
         profiles  = {}
@@ -105,13 +121,7 @@ def load_users_from_sheet():
 def update_password_in_sheet(email, new_password):
     """Update password for a user in the 'Users' worksheet. Returns True on success."""
     try:
-        sa = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(sa, scopes=[
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive",
-        ])
-        gc = gspread.authorize(creds)
-        ws = gc.open_by_key(st.secrets.get("SHEET_ID", "")).worksheet("Users")
+        ws = _open_spreadsheet().worksheet("Users")
         # Column A = email; Column B = password
         email_cells = ws.findall(email, in_column=1)
         for cell in email_cells:
@@ -127,13 +137,7 @@ def log_activity(email, action="login"):
     Creates the sheet with headers if it doesn't exist yet.
     Never raises — login must not be blocked by a logging failure."""
     try:
-        sa = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(sa, scopes=[
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive",
-        ])
-        gc     = gspread.authorize(creds)
-        wb     = gc.open_by_key(st.secrets.get("SHEET_ID", ""))
+        wb = _open_spreadsheet()
         # Get or create the Activity worksheet
         try:
             ws = wb.worksheet("Activity")
@@ -379,8 +383,6 @@ if _token_profile:
 elif _is_email_user:
     forced_profile_key = st.session_state.get("user_perfil", "general") or "general"
 
-SHEET_ID = st.secrets.get("SHEET_ID", "")
-
 # User store accessible to sidebar (for password change)
 _store_secret = {}
 try:
@@ -665,10 +667,12 @@ PROFILES = {
 # ════════════════════════════════════════════════════════════
 # HELPERS
 # ════════════════════════════════════════════════════════════
+EMPTY_MARKERS = ("nan", "None", "—", "")   # sheet placeholders shown as blank
+
 def esc(v):
     """html.escape all data before inserting into HTML."""
     s = str(v or "").strip()
-    return html_lib.escape(s) if s not in ("nan", "None", "—", "") else ""
+    return html_lib.escape(s) if s not in EMPTY_MARKERS else ""
 
 def parse_val(v):
     if not v or str(v).strip() in ("", "—", "N/A", "nan"):
@@ -717,11 +721,31 @@ def fmt(v):
     if v >= 1000: return f"€{int(v/1000)}K"
     return f"€{int(v):,}"
 
+def str_preview(series, n):
+    """Vectorised "first n chars + …" for a whole text column (… only when cut)."""
+    s = series.fillna("").astype(str)
+    short = s.str.slice(0, n)
+    return short.where(s.str.len() <= n, short + "…")
+
+def to_csv_bytes(df_out):
+    """UTF-8 CSV bytes for st.download_button.
+    Arrow's C++ writer encodes straight into a byte buffer, so the export never
+    holds a full Python str copy next to the frame. Falls back to pandas if a
+    column has mixed types Arrow can't convert."""
+    buf = io.BytesIO()
+    try:
+        pacsv.write_csv(pa.Table.from_pandas(df_out, preserve_index=False), buf)
+    except pa.ArrowException:
+        return df_out.to_csv(index=False).encode("utf-8")
+    return buf.getvalue()
+
 def sc_pill(sc):
     e = "🟢" if sc >= 65 else "🟠" if sc >= 40 else "🟡" if sc >= 20 else "⚪"
     s = SSPG if sc >= 65 else SSPO if sc >= 40 else SSPN if sc >= 20 else SSPD
     return f'<span style="{s}">{e} {sc} / 100</span>'
 
+LINKEDIN_SEARCH = "https://www.linkedin.com/search/results/all/?keywords="
+
 def build_card(row):
     """
     Build one lead card with ONLY inline styles.
@@ -944,9 +968,9 @@ def build_card(row):
         links.append(f'<a href="{maps}" target="_blank" rel="noopener" style="{SBT}">📍 Mapa</a>')
     if pdf:
         links.append(f'<a href="{pdf}" target="_blank" rel="noopener" style="{SBT}">📑 PDF</a>')
-    if prom:
-        q = html_lib.unescape(prom).replace(" ", "+")
-        links.append(f'<a href="https://www.linkedin.com/search/results/all/?keywords={html_lib.escape(q)}" target="_blank" rel="noopener" style="{SBT}">🔍 Promotor</a>')
+    prom_url = str(row.get("promotor_url", "") or "")   # built per column, see df_f["promotor_url"]
+    if prom_url:
+        links.append(f'<a href="{html_lib.escape(prom_url)}" target="_blank" rel="noopener" style="{SBT}">🔍 Promotor</a>')
 
     footer = (
         f'<div style="{SFO}">'
@@ -1073,16 +1097,84 @@ def _extract_search_query_from_maps_url(maps_url):
         return m.group(1).replace('+', ' ').strip()
     return ""
 
+@st.cache_resource
+def _http_session():
+    """One pooled keep-alive HTTP session shared by all reruns and users.
+    Geocoding a map of 200 pins reuses the same TLS connection instead of
+    opening a new one per address."""
+    s = requests.Session()
+    s.headers.update({"User-Agent": "PlanningScout/1.0"})
+    return s
+
+# On-disk geocode cache (L2). st.cache_data (L1) is RAM-only and starts empty
+# after every restart/redeploy, which made the first map render re-geocode up
+# to 200 addresses against Nominatim (1 req/s policy). SQLite is safe across
+# Streamlit's session threads and any worker sharing the same disk.
+GEOCODE_DB     = os.environ.get("GEOCODE_CACHE_DB", "/tmp/planningscout_geocode.sqlite")
+GEOCODE_DB_TTL = 30 * 86400   # seconds — street addresses don't move
+
+@st.cache_resource(show_spinner=False)
+def _geo_db():
+    """One connection + schema per process, shared by every session thread.
+    Returns (conn, lock) or (None, None) if the file can't be opened."""
+    try:
+        conn = sqlite3.connect(GEOCODE_DB, timeout=5, check_same_thread=False)
+        conn.execute("CREATE TABLE IF NOT EXISTS geocode "
+                     "(query TEXT PRIMARY KEY, lat REAL, lon REAL, ts REAL)")
+        conn.commit()
+    except sqlite3.Error:
+        return None, None
+    return conn, threading.Lock()
+
+def _geo_disk_get(query):
+    """(lat, lon) from the disk cache, or None on miss / expiry / any DB error."""
+    conn, lock = _geo_db()
+    if conn is None:
+        return None
+    try:
+        with lock:
+            row = conn.execute(
+                "SELECT lat, lon FROM geocode WHERE query = ? AND ts > ?",
+                (query, time.time() - GEOCODE_DB_TTL),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+    except sqlite3.Error:
+        return None
+
+def _geo_disk_put(query, lat, lon):
+    conn, lock = _geo_db()
+    if conn is None:
+        return
+    try:
+        with lock, conn:
+            conn.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                         (query, lat, lon, time.time()))
+    except sqlite3.Error:
+        pass  # cache only — never break the map over it
+
 @st.cache_data(ttl=86400, show_spinner=False)
 def _geocode_nominatim(query):
+    """
+    Geocode a free-text query: RAM cache (24h) → disk cache (30 days) → Nominatim.
+    Returns (lat, lon) or (None, None).
+    Only hits are persisted to disk; misses stay in the 24h RAM cache so
+    transient Nominatim errors are retried the next day.
+    """
+    hit = _geo_disk_get(query)
+    if hit is not None:
+        return hit
+    lat, lon = _nominatim_search(query)
+    if lat is not None:
+        _geo_disk_put(query, lat, lon)
+    return lat, lon
+
+def _nominatim_search(query):
     """
     Geocode a free-text query using Nominatim (OpenStreetMap).
     Returns (lat, lon) or (None, None).
     Always appends ', Comunidad de Madrid, España' to bias results.
-    Caches for 24h — no repeated calls for same address.
     """
     try:
-        import urllib.request, json, time
         q = query.strip()
         if not q or len(q) < 4:
             return None, None
@@ -1096,11 +1188,13 @@ def _geocode_nominatim(query):
             return None, None
         # Add Madrid context
         full = q_clean + ", Comunidad de Madrid, España"
-        url = (f"https://nominatim.openstreetmap.org/search"
-               f"?q={urllib.parse.quote(full)}&format=json&limit=1&countrycodes=es")
-        req = urllib.request.Request(url, headers={"User-Agent": "PlanningScout/1.0"})
-        with urllib.request.urlopen(req, timeout=5) as r:
-            data = json.loads(r.read())
+        r = _http_session().get(
+            "https://nominatim.openstreetmap.org/search",
+            params={"q": full, "format": "json", "limit": 1, "countrycodes": "es"},
+            timeout=5,
+        )
+        r.raise_for_status()
+        data = r.json()
         if data:
             lat, lon = float(data[0]["lat"]), float(data[0]["lon"])
             if _MAD_LAT_MIN <= lat <= _MAD_LAT_MAX and _MAD_LON_MIN <= lon <= _MAD_LON_MAX:
@@ -1206,16 +1300,18 @@ _PIN_COLOURS = {
     "general":      "#64748b",
 }
 
-def _score_colour(score):
-    if score >= 65: return _PIN_COLOURS["high"]
-    if score >= 40: return _PIN_COLOURS["mid"]
-    return _PIN_COLOURS["low"]
+# Popup score badge (background, foreground) per tier
+_TIER_BADGE = {
+    "high": ("#dcfce7", "#16a34a"),
+    "mid":  ("#fef3c7", "#b45309"),
+    "low":  ("#f1f5f9", "#64748b"),
+}
 
-def _make_pin_icon(score, fase=""):
-    """Create a styled DivIcon for the folium marker."""
-    colour = _score_colour(score)
+def _make_pin_icon(tier, fase=""):
+    """Create a styled DivIcon for the folium marker from the lead's score_tier."""
+    colour = _PIN_COLOURS[tier]
     # Special icon for pre-leads (solicitud)
-    symbol = "⚡" if fase == "solicitud" else ("★" if score >= 65 else "●")
+    symbol = "⚡" if fase == "solicitud" else ("★" if tier == "high" else "●")
     return folium.DivIcon(
         html=f"""<div style="
             width:28px;height:28px;border-radius:50%;
@@ -1239,24 +1335,28 @@ def build_map(df_map, profile_key="general"):
     if not _FOLIUM_OK:
         return None
 
-    # Filter to leads with mappable locations
-    rows_with_loc = []
-    with st.spinner("Geolocalizando proyectos…"):
-        for _, row in df_map.iterrows():
-            lat, lon, prec = _get_coords(row.to_dict())
-            rows_with_loc.append((row, lat, lon, prec))
+    # Popup description previews for every pin in one column pass
+    if "descripcion" in df_map.columns:
+        df_map = df_map.assign(desc_preview=str_preview(df_map["descripcion"], 120))
 
-    if not rows_with_loc:
+    if df_map.empty:
         return None
 
+    # Locate every lead (to_dict("records") — no per-row Series like iterrows)
+    with st.spinner("Geolocalizando proyectos…"):
+        coords = [_get_coords(r) for r in df_map.to_dict("records")]
+    df_map = df_map.assign(
+        _lat=[c[0] for c in coords],
+        _lon=[c[1] for c in coords],
+        _prec=[c[2] for c in coords],
+    )
+
     # Centre map on the mean of all points
-    lats = [r[1] for r in rows_with_loc]
-    lons = [r[2] for r in rows_with_loc]
-    centre_lat = sum(lats) / len(lats)
-    centre_lon = sum(lons) / len(lons)
+    centre_lat = df_map["_lat"].mean()
+    centre_lon = df_map["_lon"].mean()
 
     # Choose zoom based on spread
-    lat_range = max(lats) - min(lats)
+    lat_range = df_map["_lat"].max() - df_map["_lat"].min()
     zoom = 10 if lat_range > 0.5 else (11 if lat_range > 0.2 else 12)
 
     m = folium.Map(
@@ -1273,52 +1373,52 @@ def build_map(df_map, profile_key="general"):
         max_zoom=19,
     ).add_to(m)
 
-    # Add markers
-    for row, lat, lon, prec in rows_with_loc:
-        r = row.to_dict()
-        score   = int(r.get("score", 0) or 0)
-        muni    = r.get("municipio", "Madrid") or "Madrid"
-        addr    = r.get("direccion", "") or ""
-        tipo    = r.get("tipo", "") or ""
-        fase    = r.get("fase", "") or ""
-        pem     = r.get("pem_combined", 0) or 0
-        bocm    = r.get("bocm_url", "") or ""
-        maps_u  = r.get("maps", "") or ""
-        desc    = r.get("descripcion", "") or ""
-        fecha   = r.get("fecha", "") or ""
-        pz      = r.get("pem_est_raw", "") or ""   # Estimated PEM text
-
-        # PEM display
-        if pem >= 1_000_000:
-            pem_s = f"€{pem/1_000_000:.1f}M"
-        elif pem >= 1000:
-            pem_s = f"€{int(pem/1000)}K"
-        elif pz and "⚪" not in pz and pz.strip():
-            pem_s = pz[:30]
-        else:
-            pem_s = "PEM no declarado"
-
-        # Score badge colour
-        sc_bg = "#dcfce7" if score >= 65 else ("#fef3c7" if score >= 40 else "#f1f5f9")
-        sc_fg = "#16a34a" if score >= 65 else ("#b45309" if score >= 40 else "#64748b")
-
-        # Precision indicator (only show when approximate)
-        prec_note = ""
-        if prec == "municipality":
-            prec_note = f"<div style='font-size:10px;color:#94a3b8;margin-top:4px;'>📍 Ubicación aproximada ({muni})</div>"
-        elif prec == "geocoded":
-            prec_note = f"<div style='font-size:10px;color:#94a3b8;margin-top:4px;'>📍 Zona estimada</div>"
-
-        # Pre-lead badge
-        prelead_badge = ""
-        if fase == "solicitud":
-            prelead_badge = "<span style='background:#fef3c7;color:#b45309;font-size:10px;font-weight:700;padding:2px 6px;border-radius:4px;margin-right:4px;'>⚡ PRE-LEAD</span>"
-
-        # Links
-        link_bocm  = f'<a href="{bocm}" target="_blank" style="color:#1e3a5f;font-weight:600;font-size:12px;text-decoration:none;">↗ Ver BOCM</a>' if bocm else ""
-        link_maps  = f'<a href="{maps_u}" target="_blank" style="color:#1e3a5f;font-weight:600;font-size:12px;text-decoration:none;margin-left:10px;">🗺️ Maps</a>' if maps_u else ""
-
-        popup_html = f"""
+    # Add markers — one pass per score bucket (mask selection, no per-pin
+    # branching on the score). Buckets go low → high so the high-priority pins
+    # are drawn last, on top of the others.
+    for tier in ("low", "mid", "high"):
+        sc_bg, sc_fg = _TIER_BADGE[tier]   # popup score badge colour
+        for r in df_map[df_map["score_tier"] == tier].to_dict("records"):
+            lat, lon, prec = r["_lat"], r["_lon"], r["_prec"]
+            score   = int(r.get("score", 0) or 0)
+            muni    = r.get("municipio", "Madrid") or "Madrid"
+            addr    = r.get("direccion", "") or ""
+            tipo    = r.get("tipo", "") or ""
+            fase    = r.get("fase", "") or ""
+            pem     = r.get("pem_combined", 0) or 0
+            bocm    = r.get("bocm_url", "") or ""
+            maps_u  = r.get("maps", "") or ""
+            desc    = r.get("desc_preview", "") or ""
+            fecha   = r.get("fecha", "") or ""
+            pz      = r.get("pem_est_raw", "") or ""   # Estimated PEM text
+
+            # PEM display
+            if pem >= 1_000_000:
+                pem_s = f"€{pem/1_000_000:.1f}M"
+            elif pem >= 1000:
+                pem_s = f"€{int(pem/1000)}K"
+            elif pz and "⚪" not in pz and pz.strip():
+                pem_s = pz[:30]
+            else:
+                pem_s = "PEM no declarado"
+
+            # Precision indicator (only show when approximate)
+            prec_note = ""
+            if prec == "municipality":
+                prec_note = f"<div style='font-size:10px;color:#94a3b8;margin-top:4px;'>📍 Ubicación aproximada ({muni})</div>"
+            elif prec == "geocoded":
+                prec_note = f"<div style='font-size:10px;color:#94a3b8;margin-top:4px;'>📍 Zona estimada</div>"
+
+            # Pre-lead badge
+            prelead_badge = ""
+            if fase == "solicitud":
+                prelead_badge = "<span style='background:#fef3c7;color:#b45309;font-size:10px;font-weight:700;padding:2px 6px;border-radius:4px;margin-right:4px;'>⚡ PRE-LEAD</span>"
+
+            # Links
+            link_bocm  = f'<a href="{bocm}" target="_blank" style="color:#1e3a5f;font-weight:600;font-size:12px;text-decoration:none;">↗ Ver BOCM</a>' if bocm else ""
+            link_maps  = f'<a href="{maps_u}" target="_blank" style="color:#1e3a5f;font-weight:600;font-size:12px;text-decoration:none;margin-left:10px;">🗺️ Maps</a>' if maps_u else ""
+
+            popup_html = f"""
 <div style="font-family:'Plus Jakarta Sans',system-ui,sans-serif;min-width:240px;max-width:300px;">
   <div style="background:#f7f8fa;border-radius:8px 8px 0 0;padding:10px 12px;border-bottom:1px solid #e2e8f0;">
     <div style="font-size:11px;font-weight:700;color:#64748b;text-transform:uppercase;letter-spacing:.06em;">{muni}</div>
@@ -1331,21 +1431,21 @@ def build_map(df_map, profile_key="general"):
       <span style="background:#eff4fb;color:#1e3a5f;font-size:11px;padding:2px 8px;border-radius:100px;">{tipo[:30]}</span>
     </div>
     <div style="font-size:13px;font-weight:700;color:#1e3a5f;margin-bottom:4px;">{pem_s}</div>
-    <div style="font-size:11px;color:#64748b;line-height:1.4;margin-bottom:8px;">{desc[:120]}{'…' if len(desc) > 120 else ''}</div>
+    <div style="font-size:11px;color:#64748b;line-height:1.4;margin-bottom:8px;">{desc}</div>
     <div style="font-size:11px;color:#94a3b8;">{fecha}</div>
     {prec_note}
     <div style="margin-top:8px;border-top:1px solid #f1f5f9;padding-top:8px;">{link_bocm}{link_maps}</div>
   </div>
 </div>"""
 
-        folium.Marker(
-            location=[lat, lon],
-            popup=folium.Popup(popup_html, max_width=310),
-            tooltip=f"{muni} · {pem_s} · {score}pts",
-            icon=_make_pin_icon(score, fase),
-        ).add_to(m)
+            folium.Marker(
+                location=[lat, lon],
+                popup=folium.Popup(popup_html, max_width=310),
+                tooltip=f"{muni} · {pem_s} · {score}pts",
+                icon=_make_pin_icon(tier, fase),
+            ).add_to(m)
 
-    return m, len(rows_with_loc)
+    return m, len(df_map)
 
 
 # ════════════════════════════════════════════════════════════
@@ -1366,18 +1466,28 @@ COL_MAP = {
     "Project Size": "project_size",
 }
 
-@st.cache_data(ttl=300)
+# The scraper writes to the sheet once a day, so a 15-min TTL is plenty fresh.
+# Filter widgets (score, PEM, fase…) only re-slice the cached frame — they never
+# trigger a new Sheets round-trip. "Actualizar datos" forces a refetch.
+@st.cache_data(ttl=900, show_spinner=False)
 def load_data():
     try:
-        sa = dict(st.secrets["gcp_service_account"])
-        creds = Credentials.from_service_account_info(sa, scopes=[
-            "https://www.googleapis.com/auth/spreadsheets",
-            "https://www.googleapis.com/auth/drive",
-        ])
-        gc = gspread.authorize(creds)
-        ws = gc.open_by_key(st.secrets.get("SHEET_ID", SHEET_ID)).worksheet("Permits")
-        data = ws.get_all_records()
-        return pd.DataFrame(data) if data else pd.DataFrame()
+        ws = _open_spreadsheet().worksheet("Permits")
+        # Header row + plain value rows straight into the frame — no per-row
+        # {header: value} dict and no numericising pass (every parser below
+        # already works on the raw text). Short rows are padded with "".
+        values = ws.get_all_values()
+        if len(values) < 2:
+            return pd.DataFrame()
+        # Same guard get_all_records() had: a repeated header would make df["x"]
+        # a DataFrame instead of a Series. Blank header cells (padding) are dropped.
+        hdr   = values[0]
+        dupes = sorted({h for h in hdr if h and hdr.count(h) > 1})
+        if dupes:
+            raise gspread.exceptions.GSpreadException(
+                f"the header row in the worksheet contains duplicates: {dupes}")
+        keep = [i for i, h in enumerate(hdr) if h]
+        return pd.DataFrame(values[1:], columns=hdr).iloc[:, keep].fillna("")
     except Exception as ex:
         st.error(f"Error conectando a Google Sheets: {ex}")
         return pd.DataFrame()
@@ -1401,16 +1511,16 @@ if df_raw.empty:
     st.stop()
 
 df = df_raw.rename(columns={k: v for k, v in COL_MAP.items() if k in df_raw.columns})
+# Free-text columns (also the keyword-search fields) as Arrow-backed strings:
+# contiguous UTF-8 buffers instead of one Python str per cell, and the
+# .str.contains() filters below run in Arrow's C++ kernels.
+TEXT_COLS = ["municipio", "direccion", "promotor", "tipo", "descripcion", "expediente"]
+df = df.astype({c: "string[pyarrow]" for c in TEXT_COLS if c in df.columns})
 df["pem"]          = df["pem_raw"].apply(parse_val)                  if "pem_raw"     in df.columns else pd.Series(0.0, index=df.index)
 df["pem_est"]      = df["pem_est_raw"].apply(parse_est_pem_numeric)  if "pem_est_raw" in df.columns else pd.Series(0.0, index=df.index)
 # pem_combined: declared PEM if > 0, else AI-estimated PEM
 # pem_est was computed above from pem_est_raw column
-if "pem" in df.columns and "pem_est" in df.columns:
-    df["pem_combined"] = df.apply(lambda r: r["pem"] if r["pem"] > 0 else r["pem_est"], axis=1)
-elif "pem" in df.columns:
-    df["pem_combined"] = df["pem"]
-else:
-    df["pem_combined"] = 0
+df["pem_combined"] = df["pem"].where(df["pem"] > 0, df["pem_est"])
 
 # 3. LIMPIEZA DE SCORE: Función robusta para evitar errores de formato
 def parse_sc(val):
@@ -1424,28 +1534,46 @@ def parse_sc(val):
         return 0
 
 # 4. APLICACIÓN DEL SCORE: Busca la columna original 'score_raw'
+# Same cleaning as parse_sc(), applied to the whole column in one pass
 if "score_raw" in df.columns:
-    df["score"] = df["score_raw"].apply(parse_sc)
+    _sc = (df["score_raw"].astype(str)
+           .str.replace(".", "", regex=False)
+           .str.replace(",", ".", regex=False)
+           .str.strip())
+    # ±inf ("inf", "Infinity", 1e400) → 0 like parse_sc; astype(int) would raise on it
+    df["score"] = (pd.to_numeric(_sc, errors="coerce")
+                   .replace([np.inf, -np.inf], 0).fillna(0).astype(int))
 else:
     df["score"] = 0
 
-def _best_date(row):
-    """Use the most recent of Date Found and Date Granted.
-    Many leads have fecha_encontrado = fecha_granted (wrong value),
-    so this prevents valid leads from being excluded by date filter."""
-    best = None
-    for col in ["fecha_encontrado", "fecha"]:
-        v = str(row.get(col, "") or "").strip()[:10]
-        if len(v) == 10:
-            try:
-                dt = pd.to_datetime(v)
-                if best is None or dt > best:
-                    best = dt
-            except Exception:
-                pass
-    return best if best is not None else pd.NaT
-
-df["fecha_dt"] = df.apply(_best_date, axis=1)
+# Priority tier (keys of _PIN_COLOURS), bucketed once for the whole column
+# instead of re-branching on the score per pin / per metric.
+df["score_tier"] = np.select(
+    [df["score"] >= 65, df["score"] >= 40], ["high", "mid"], default="low"
+)
+
+def _col_dates(col):
+    """Parse the first 10 chars of a date column. YYYY-MM-DD in one vectorised
+    pass; whatever is left (15/10/2026, 15-10-2026…) is retried day-first.
+    Ambiguous dates are read as dd/mm (Spanish sheet): 03/10/2026 is 3 October.
+    The old per-row pd.to_datetime read it month-first, as 10 March."""
+    if col not in df.columns:
+        return pd.Series(pd.NaT, index=df.index)
+    v  = df[col].fillna("").astype(str).str.strip().str[:10]
+    v  = v.where(v.str.len() == 10)
+    dt = pd.to_datetime(v, errors="coerce", format="ISO8601")
+    # dayfirst can't go in the ISO pass: format="mixed" would read 2026-10-03 as 10 March
+    retry = dt.isna() & v.notna()
+    if retry.any():
+        dt[retry] = pd.to_datetime(v[retry], errors="coerce", format="mixed", dayfirst=True)
+    return dt
+
+# Use the most recent of Date Found and Date Granted.
+# Many leads have fecha_encontrado = fecha_granted (wrong value),
+# so this prevents valid leads from being excluded by date filter.
+df["fecha_dt"] = pd.concat(
+    [_col_dates("fecha_encontrado"), _col_dates("fecha")], axis=1
+).max(axis=1)
 
 all_munis = sorted([
     m for m in (df["municipio"].dropna().unique().tolist() if "municipio" in df.columns else [])
@@ -1518,6 +1646,10 @@ with st.sidebar:
     )
     min_pem   = st.number_input("PEM mínimo (€)", value=prof["min_value"], min_value=0, step=50_000, format="%d")
     min_score = st.slider("Puntuación mínima", 0, 100, value=prof["min_score"], step=5)
+    display_limit = int(st.number_input(
+        "Mostrar top N", min_value=10, max_value=500, value=50, step=10,
+        help="Proyectos mostrados como ficha. El resto sigue en la tabla y en el CSV.",
+    ))
 
     # ── Phase filter ──
     _FASE_OPTIONS = {
@@ -1545,7 +1677,8 @@ with st.sidebar:
     st.markdown('<div style="height:1px;background:#e2e8f0;margin:14px 0 16px;"></div>', unsafe_allow_html=True)
 
     if st.button("🔄 Actualizar datos"):
-        st.cache_data.clear()
+        # Only drop the Permits cache — keep the 24h geocode cache warm
+        load_data.clear()
         st.rerun()
 
     if not is_locked:
@@ -1651,20 +1784,30 @@ if fase_sel and "fase" in df_f.columns:
 
 # ── Keyword search across key text fields ──
 if kw_search:
-    _search_cols = ["municipio", "direccion", "promotor", "tipo", "descripcion", "expediente"]
-    _mask = pd.Series([False] * len(df_f), index=df_f.index)
-    for _col in _search_cols:
+    _mask = pd.Series(False, index=df_f.index)
+    for _col in TEXT_COLS:
         if _col in df_f.columns:
-            _mask = _mask | df_f[_col].astype(str).str.lower().str.contains(
-                re.escape(kw_search), na=False)
+            # case-insensitive literal match — no lowered copy of the column
+            _mask = _mask | df_f[_col].str.contains(
+                kw_search, case=False, regex=False, na=False)
     df_f = df_f[_mask]
 
-df_f = df_f.sort_values(["score", "pem_combined"], ascending=[False, False]).reset_index(drop=True)
+# Ranked once: cards (top N), map (top 200), overflow table and CSV all reuse this order
+RANK_COLS = ["score", "pem_combined"]
+df_f = df_f.sort_values(RANK_COLS, ascending=False).reset_index(drop=True)
+
+# ── Promotor search link, built for the whole column at once ──
+# quote_plus encodes &, /, accents… (the old per-card " "→"+" broke on "&")
+if "promotor" in df_f.columns:
+    _prom = df_f["promotor"].fillna("").astype(str).str.strip()
+    _prom_q = pd.Series([urllib.parse.quote_plus(x) for x in _prom], index=df_f.index, dtype=object)
+    # Same blanks as esc(), so the card and the table agree on when to link
+    df_f["promotor_url"] = (LINKEDIN_SEARCH + _prom_q).where(~_prom.isin(EMPTY_MARKERS), "")
 
 # ── Metrics ──
 total_pem  = df_f["pem_combined"].sum()
 count      = len(df_f)
-high_leads = len(df_f[df_f["score"] >= 65])
+high_leads = int((df_f["score_tier"] == "high").sum())
 avg_score  = int(df_f["score"].mean()) if count > 0 else 0
 
 # Format total PEM
@@ -1706,7 +1849,7 @@ st.markdown(
 # ── Export ──
 if not df_f.empty:
     exp_cols = [c for c in ["fecha","municipio","direccion","promotor","tipo","pem_raw","descripcion","expediente","bocm_url"] if c in df_f.columns]
-    csv = df_f[exp_cols].to_csv(index=False).encode("utf-8")
+    csv = to_csv_bytes(df_f[exp_cols])
     col_dl, _ = st.columns([1, 3])
     with col_dl:
         st.download_button(
@@ -1721,6 +1864,24 @@ st.markdown("<div style='height:8px'></div>", unsafe_allow_html=True)
 # ════════════════════════════════════════════════════════════
 # TABS — Lista de leads  |  Mapa interactivo
 # ════════════════════════════════════════════════════════════
+# Compact table for leads beyond the top-N cards
+TABLE_COLS = ["score", "municipio", "direccion", "tipo", "descripcion", "promotor",
+              "pem_combined", "fecha", "bocm_url", "maps", "pdf_url", "promotor_url"]
+TABLE_COLUMN_CONFIG = {
+    "score":        st.column_config.NumberColumn("Puntos", format="%d"),
+    "municipio":    st.column_config.TextColumn("Municipio"),
+    "direccion":    st.column_config.TextColumn("Dirección"),
+    "tipo":         st.column_config.TextColumn("Tipo"),
+    "descripcion":  st.column_config.TextColumn("Descripción"),
+    "promotor":     st.column_config.TextColumn("Promotor"),
+    "pem_combined": st.column_config.NumberColumn("PEM (€)", format="€%d"),
+    "fecha":        st.column_config.TextColumn("Fecha"),
+    "bocm_url":     st.column_config.LinkColumn("Fuente", display_text="↗ Ver"),
+    "maps":         st.column_config.LinkColumn("Mapa", display_text="📍 Mapa"),
+    "pdf_url":      st.column_config.LinkColumn("PDF", display_text="📑 PDF"),
+    "promotor_url": st.column_config.LinkColumn("Buscar", display_text="🔍 Promotor"),
+}
+
 _tab_leads, _tab_mapa = st.tabs(["📋  Lista de proyectos", "🗺️  Mapa interactivo"])
 
 # ── TAB 1: LEADS LIST ────────────────────────────────────────
@@ -1751,8 +1912,33 @@ with _tab_leads:
             f'</div>',
             unsafe_allow_html=True
         )
-        for _, row in df_f.iterrows():
-            st.markdown(build_card(row.to_dict()), unsafe_allow_html=True)
+        # Full cards for the top leads, sent as ONE markdown element instead of
+        # one element per lead (each st.* call is a separate websocket delta).
+        st.markdown(
+            "\n".join(build_card(r) for r in df_f.head(display_limit).to_dict("records")),
+            unsafe_allow_html=True,
+        )
+
+        # Everything past the top N → a single virtualised grid
+        df_rest = df_f.iloc[display_limit:]
+        if not df_rest.empty:
+            st.markdown(
+                f'<h3 style="font-family:\'Fraunces\',Georgia,serif;font-size:16px;font-weight:700;'
+                f'color:#0d1a2b;margin:22px 0 10px;">Más proyectos ({len(df_rest)})</h3>',
+                unsafe_allow_html=True
+            )
+            tbl_cols = [c for c in TABLE_COLS if c in df_rest.columns]
+            df_tbl   = df_rest[tbl_cols]
+            if "descripcion" in tbl_cols:
+                # The grid only shows one line — don't ship full texts to the browser
+                df_tbl = df_tbl.assign(descripcion=str_preview(df_tbl["descripcion"], 150))
+            st.dataframe(
+                df_tbl,
+                column_config={k: v for k, v in TABLE_COLUMN_CONFIG.items() if k in tbl_cols},
+                column_order=tbl_cols,
+                hide_index=True,
+                use_container_width=True,
+            )
 
 # ── TAB 2: INTERACTIVE MAP ───────────────────────────────────
 with _tab_mapa:
@@ -1775,8 +1961,7 @@ with _tab_mapa:
 </div>""", unsafe_allow_html=True)
 
         # Map size control — Expansion directors want a large overview
-        _map_rows = min(len(df_f), 200)   # cap at 200 pins for performance
-        df_map = df_f.head(_map_rows)
+        df_map = df_f.head(200)   # cap at 200 pins for performance
 
         result = build_map(df_map, profile_key=prof["key"])
         if result:
@@ -1,10 +1,13 @@
 import subprocess, sys
 subprocess.check_call([sys.executable, "-m", "pip", "install",
     "requests", "beautifulsoup4", "pdfplumber", "gspread",
-    "google-auth", "python-dateutil", "openai", "-q"])
+    "google-auth", "python-dateutil", "openai", "pyahocorasick", "orjson", "-q"])
 
 import requests, re, io, time, json, os, smtplib, random
+import orjson   # fast parser for the large API / JSON-LD payloads
 import threading
+from functools import lru_cache
+from types import MappingProxyType
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
@@ -18,6 +21,11 @@ import urllib3
 import xml.etree.ElementTree as ET
 from bs4 import BeautifulSoup as BS4  # Rename to avoid conflict
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+try:
+    import ahocorasick   # multi-keyword matcher for score_lead
+    _AC_OK = True
+except ImportError:
+    _AC_OK = False
 
 # ════════════════════════════════════════════════════════════
 # TIME BUDGET  —  graceful exit before GitHub kills the job
@@ -948,8 +956,10 @@ def extract_date_from_url(url):
 
 def extract_jsonld(soup):
     for script in soup.find_all("script", {"type":"application/ld+json"}):
+        if script.string is None: continue
         try:
-            data = json.loads(script.string)
+            # .string is a NavigableString (str subclass) — orjson only takes exact str/bytes
+            data = orjson.loads(script.string.encode())
             if isinstance(data, list): data = data[0]
             if data.get("text"):
                 pdf_url = None
@@ -2242,10 +2252,136 @@ def classify_permit(text):
 # ════════════════════════════════════════════════════════════
 # LEAD SCORING (0–100)
 # ════════════════════════════════════════════════════════════
+# Every keyword group score_lead looks for, tagged by category. All groups are
+# loaded into ONE Aho-Corasick automaton, so each text is scanned once for all
+# ~130 keywords instead of once per group. Plain substring semantics — several
+# keys rely on it ("dir ", "pau-", "bar ").
+SCORE_KEYWORDS = {
+    # Hospitality / Flexliving — cambio de uso to residential/hospedaje
+    "hospe": [
+        "cambio de uso", "cambio de destino", "uso residencial", "uso hospedaje",
+        "rehabilitación integral", "rehabilitación de edificio", "reforma integral",
+        "apartamentos turísticos", "viviendas de uso turístico", "uso hotelero",
+        "residencia de estudiantes", "edificio plurifamiliar", "edificio de viviendas",
+        "primera ocupación",
+    ],
+    # Prime Madrid barrios (Sharing Co operates here) + the works that qualify
+    "prime_barrio": [
+        "centro", "salamanca", "chamberí", "malasaña", "chueca",
+        "lavapiés", "retiro", "almagro", "castellana", "legazpi",
+        "arganzuela", "justicia", "embajadores", "sol", "ópera",
+    ],
+    "prime_works":     ["cambio de uso", "rehabilitación", "obra mayor"],
+    "urbanizacion":    ["proyecto de urbanización", "junta de compensación", "reparcelación"],
+    "industrial":      ["nave industrial", "centro logístico", "parque empresarial"],
+    "new_build":       ["nueva construcción", "nueva planta"],
+    "demolition":      ["demolición", "derribo"],
+    "logistics_muni": [
+        "valdemoro", "getafe", "coslada", "alcalá de henares", "torrejón de ardoz",
+        "arganda del rey", "fuenlabrada", "alcobendas", "san sebastián de los reyes",
+        "rivas-vaciamadrid", "mejorada del campo", "pinto", "parla",
+    ],
+    "eu_funds":        ["rehabilitación energética", "eficiencia energética",
+                        "fondos next generation", "plan de recuperación"],
+    "dir":             ["declaración de interés regional", "dir ", "actuación de dotación",
+                        "proyecto de actuación especial"],
+    "surface":         ["m²", "metros cuadrados", "superficie útil"],
+    "retail_food":     ["restauración", "cafetería", "comida", "actividad alimentaria",
+                        "establecimiento de comida", "obrador", "panadería", "take away"],
+    "large_surface":   ["gran superficie", "centro comercial", "uso mixto",
+                        "actividad de ocio", "uso dotacional", "parque comercial"],
+    "actiu": [
+        "edificio de oficinas", "uso oficinas", "coworking", "espacio de trabajo",
+        "reforma de oficinas", "adecuación de local", "uso terciario",
+        "edificio terciario", "centro de negocios",
+        "centro educativo", "colegio", "universidad", "residencia de estudiantes",
+    ],
+    "saneamiento":     ["saneamiento", "colector", "red de abastecimiento",
+                        "conducción de agua", "abastecimiento de agua",
+                        "red de saneamiento", "pluviales", "drenaje"],
+    "fcc":             ["área de planeamiento específico", "pau-", "pau ",
+                        "plan de actuación urbanística", "licitación de obra pública",
+                        "ayuntamiento de madrid", "licitación en madrid"],
+    # Kiloutou is scored by HOW MANY distinct signals appear
+    "kiloutou":        ["demolición", "derribo", "vaciado", "excavación",
+                        "explanación", "desescombro", "movimiento de tierras",
+                        "cimentación"],
+    "retail_location": [
+        "centro comercial", "parque comercial", "zona comercial",
+        "equipamiento comercial", "planta baja comercial",
+        "uso terciario comercial", "galería comercial",
+        "nueva urbanización", "nuevo barrio", "nueva área residencial",
+    ],
+}
+
+# Flat "+N if the group matched" bonuses, compiled into _flat_bonus at import.
+# Bonuses that depend on more than one signal (PEM, municipio, keyword count…)
+# stay inline there.
+SCORE_BONUS_RULES = (
+    ("hospe",           10),  # Hospitality / Flexliving — operators need to act early on these
+    ("eu_funds",        10),  # EU Next Gen rehab — confirmed funding = confirmed project
+    ("dir",             15),  # DIRs — the biggest signals for land investment (Promotores/RE)
+    ("retail_food",      6),  # Malvón / small food retail — franchise expansion is time-sensitive
+    ("large_surface",    8),  # Kinépolis — large format = high-value for cinema/leisure operators
+    ("actiu",            8),  # ACTIU — every new/refurbished office/edu/hospitality = contract sale
+    ("retail_location",  6),  # Saona/Kinépolis/Malvón — new barrio / high footfall = future location
+)
+
+def _build_bonus_fn(rules):
+    """Compiles the rule table into a straight-line function, one `in` test per
+    rule — no loop, tuple unpacking or generator frame per scored lead."""
+    lines = ["def _flat_bonus(hits):", "    s = 0"]
+    for cat, pts in rules:
+        lines.append(f"    if {cat!r} in hits: s += {int(pts)}")
+    lines.append("    return s")
+    ns = {}
+    exec(compile("\n".join(lines), "<SCORE_BONUS_RULES>", "exec"), ns)
+    return ns["_flat_bonus"]
+
+_flat_bonus = _build_bonus_fn(SCORE_BONUS_RULES)
+
+def _build_score_automaton():
+    if not _AC_OK:
+        return None
+    # A keyword can belong to several groups ("demolición" → demolition + kiloutou)
+    cats_by_kw = {}
+    for cat, words in SCORE_KEYWORDS.items():
+        for w in words:
+            cats_by_kw.setdefault(w, []).append(cat)
+    ac = ahocorasick.Automaton()
+    for w, cats in cats_by_kw.items():
+        ac.add_word(w, (w, tuple(cats)))
+    ac.make_automaton()
+    return ac
+
+SCORE_AC = _build_score_automaton()
+
+# Memoised on the text: a lead is rescored after its PEM is filled in
+# (process_one, BOE, datos.madrid), but its description never changes, so the
+# keyword scan is only paid once. The result is shared by every caller with the
+# same text, so it is handed out read-only.
+@lru_cache(maxsize=4096)
+def _text_hits(text):
+    """Returns a read-only {category: number of DISTINCT keywords of that category found in text}.
+    Falls back to plain substring tests when pyahocorasick is unavailable."""
+    hits = {}
+    if SCORE_AC is None:
+        for cat, words in SCORE_KEYWORDS.items():
+            n = sum(1 for w in words if w in text)
+            if n: hits[cat] = n
+        return MappingProxyType(hits)
+    found = {w: cats for _, (w, cats) in SCORE_AC.iter(text)}
+    for cats in found.values():
+        for cat in cats:
+            hits[cat] = hits.get(cat, 0) + 1
+    return MappingProxyType(hits)
+
 def score_lead(p):
     score = 0
     desc  = ((p.get("description","") or "") + " " + (p.get("permit_type","") or "")).lower()
     muni  = (p.get("municipality","") or "").lower()
+    hits      = _text_hits(desc)
+    muni_hits = _text_hits(muni)
 
     # Project type
     pt = p.get("permit_type","").lower()
@@ -2262,23 +2398,9 @@ def score_lead(p):
     elif pt in ("obra mayor rehabilitación","cambio de uso","declaración responsable obra mayor"):
         score += 25   # bumped from 22 — cambio de uso is high-value for hospe/retail
 
-    # Hospitality / Flexliving bonus — cambio de uso to residential/hospedaje
-    _hospe_signals = [
-        "cambio de uso", "cambio de destino", "uso residencial", "uso hospedaje",
-        "rehabilitación integral", "rehabilitación de edificio", "reforma integral",
-        "apartamentos turísticos", "viviendas de uso turístico", "uso hotelero",
-        "residencia de estudiantes", "edificio plurifamiliar", "edificio de viviendas",
-        "primera ocupación",
-    ]
-    if any(k in desc for k in _hospe_signals):
-        score += 10   # hospe/flexliving operators need to act early on these
-
     # Prime Madrid barrios bonus for cambio de uso / rehab (Sharing Co operates here)
-    _prime_barrios = {"centro", "salamanca", "chamberí", "malasaña", "chueca",
-                      "lavapiés", "retiro", "almagro", "castellana", "legazpi",
-                      "arganzuela", "justicia", "embajadores", "sol", "ópera"}
-    if any(b in muni.lower() or b in desc for b in _prime_barrios):
-        if any(k in desc for k in ["cambio de uso", "rehabilitación", "obra mayor"]):
+    if "prime_barrio" in muni_hits or "prime_barrio" in hits:
+        if "prime_works" in hits:
             score += 6
     elif pt in ("obra mayor",):
         score += 18
@@ -2290,11 +2412,11 @@ def score_lead(p):
         # Confirmed active obra — very actionable for MEP/MAT
         score += 30
     else:
-        if any(k in desc for k in ["proyecto de urbanización","junta de compensación","reparcelación"]):
+        if "urbanizacion" in hits:
             score += 40
-        elif any(k in desc for k in ["nave industrial","centro logístico","parque empresarial"]):
+        elif "industrial" in hits:
             score += 33
-        elif any(k in desc for k in ["nueva construcción","nueva planta"]):
+        elif "new_build" in hits:
             score += 28
         elif "obra mayor" in desc: score += 18
         else: score += 5
@@ -2320,58 +2442,22 @@ def score_lead(p):
         elif val >= 50_000:     score += 6
 
     # Logistics corridor bonus — industrial in prime Madrid logistics belt
-    logistics_munis = {"valdemoro","getafe","coslada","alcalá de henares","torrejón de ardoz",
-                       "arganda del rey","fuenlabrada","alcobendas","san sebastián de los reyes",
-                       "rivas-vaciamadrid","mejorada del campo","pinto","parla"}
-    if any(m in muni for m in logistics_munis) and "industrial" in pt:
+    if "logistics_muni" in muni_hits and "industrial" in pt:
         score += 5
 
-    # EU Next Gen rehabilitation bonus — confirmed budget, MEP priority
-    if any(k in desc for k in ["rehabilitación energética","eficiencia energética",
-                                "fondos next generation","plan de recuperación"]):
-        score += 10  # High commercial value: confirmed funding = confirmed project
-
-    # DIRs and major land development bonus for Promotores/RE
-    if any(k in desc for k in ["declaración de interés regional","dir ","actuación de dotación",
-                                "proyecto de actuación especial"]):
-        score += 15  # DIRs are the biggest signals for land investment
-
     # Retail bonus when m² declared (size-confirmed opportunity)
     if "licencia de actividad" in pt or "apertura" in desc:
-        if any(k in desc for k in ["m²","metros cuadrados","superficie útil"]):
+        if "surface" in hits:
             score += 8
 
-    # Malvón / small food retail bonus — licencias de apertura with surface in prime zones
-    _retail_food_signals = ["restauración","cafetería","comida","actividad alimentaria",
-                             "establecimiento de comida","obrador","panadería","take away"]
-    if any(k in desc for k in _retail_food_signals):
-        score += 6   # food franchise expansion is time-sensitive
-
-    # Kinépolis / large leisure surface bonus (>500m² commercial)
-    _large_surface_signals = ["gran superficie","centro comercial","uso mixto",
-                               "actividad de ocio","uso dotacional","parque comercial"]
-    if any(k in desc for k in _large_surface_signals):
-        score += 8   # large format = high-value for cinema/leisure operators
-
-    # ACTIU — office fit-out bonus: any confirmed office, coworking, hotel or edu build
-    _actiu_signals = ["edificio de oficinas","uso oficinas","coworking","espacio de trabajo",
-                      "reforma de oficinas","adecuación de local","uso terciario",
-                      "edificio terciario","centro de negocios",
-                      "centro educativo","colegio","universidad","residencia de estudiantes"]
-    if any(k in desc for k in _actiu_signals):
-        score += 8   # every new/refurbished office/edu/hospitality = ACTIU contract sale
-
     # Demolition + new construction = double signal for machinery + materials
-    if any(k in desc for k in ["demolición","derribo"]) and any(k in desc for k in ["nueva construcción","nueva planta"]):
+    if "demolition" in hits and "new_build" in hits:
         score += 6
 
     # ── Molecor / Compras — saneamiento projects = direct PVC pipe sales ────────
     # Every urbanización with saneamiento is a confirmed Molecor sales opportunity.
     # Large PEM + saneamiento = high-value lead for materials purchasing team.
-    _saneamiento_signals = ["saneamiento", "colector", "red de abastecimiento",
-                            "conducción de agua", "abastecimiento de agua",
-                            "red de saneamiento", "pluviales", "drenaje"]
-    if any(k in desc for k in _saneamiento_signals):
+    if "saneamiento" in hits:
         if val and val >= 2_000_000:
             score += 8   # large saneamiento project = confirmed Molecor pipeline
         else:
@@ -2380,33 +2466,20 @@ def score_lead(p):
     # ── FCC / Gran Constructora — licitación in Madrid = highest-value signal ──
     # FCC Construcción's primary client is Ayuntamiento de Madrid (46 contracts in 5yr).
     # A licitación in Madrid capital or a PAU/APE = their core business.
-    _fcc_signals = ["área de planeamiento específico", "pau-", "pau ",
-                    "plan de actuación urbanística", "licitación de obra pública",
-                    "ayuntamiento de madrid", "licitación en madrid"]
-    if any(k in desc for k in _fcc_signals) and "madrid" in muni:
+    if "fcc" in hits and "madrid" in muni:
         score += 8
 
     # ── Kiloutou / Alquiler Maquinaria — demolición + excavación = immediate need ─
     # José Luis Aliaga (Kiloutou): demolición + vaciado + excavación = call NOW.
     # These are the earliest signals — machinery needed before obra starts.
-    _kiloutou_signals = ["demolición", "derribo", "vaciado", "excavación",
-                         "explanación", "desescombro", "movimiento de tierras",
-                         "cimentación"]
-    _kiloutou_count = sum(1 for k in _kiloutou_signals if k in desc)
+    _kiloutou_count = hits.get("kiloutou", 0)
     if _kiloutou_count >= 2:
         score += 8   # multiple earthwork signals = confirmed machinery need
     elif _kiloutou_count == 1:
         score += 4
 
-    # ── Saona/Kinépolis/Malvón — new urban development = future restaurant location ─
-    # Retail/restaurant expansion needs: new barrios, centros comerciales, alta afluencia.
-    # A new urbanización = new population = new restaurant location in 2-3 years.
-    _retail_location_signals = ["centro comercial", "parque comercial", "zona comercial",
-                                 "equipamiento comercial", "planta baja comercial",
-                                 "uso terciario comercial", "galería comercial",
-                                 "nueva urbanización", "nuevo barrio", "nueva área residencial"]
-    if any(k in desc for k in _retail_location_signals):
-        score += 6   # confirmed commercial/high-footfall zone = expansion target
+    # Flat keyword-group bonuses — see SCORE_BONUS_RULES
+    score += _flat_bonus(hits)
 
     # Data completeness
     if p.get("address"):    score += 8
@@ -4519,21 +4592,24 @@ def search_boe_construction(date_from, date_to, global_seen):
         dl = dept.lower()
         return any(d in dl for d in _TARGET_DEPTS)
 
+    # BOE requires a clean session — BOCM cookies cause BOE to redirect to HTML.
+    # Use a dedicated BOE session with BOE-specific headers only.
+    # Created ONCE for the whole scan so every day reuses the same keep-alive
+    # connection (one TLS handshake instead of one per sumario).
+    boe_sess = requests.Session()
+    boe_sess.headers.update({
+        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
+        "Accept": "application/xml, text/xml, */*;q=0.8",
+        "Accept-Language": "es-ES,es;q=0.9",
+        "Referer": "https://www.boe.es/",
+        "Connection": "keep-alive",
+    })
+
     for day in scan_days:
         if not time_ok(need_s=30): break
         sumario_id = f"BOE-S-{day.strftime('%Y%m%d')}"
         xml_url    = f"{BOE_BASE}/diario_boe/xml.php?id={sumario_id}"
         try:
-            # BOE requires a clean session — BOCM cookies cause BOE to redirect to HTML.
-            # Use a dedicated BOE session with BOE-specific headers only.
-            boe_sess = requests.Session()
-            boe_sess.headers.update({
-                "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36",
-                "Accept": "application/xml, text/xml, */*;q=0.8",
-                "Accept-Language": "es-ES,es;q=0.9",
-                "Referer": "https://www.boe.es/",
-                "Connection": "keep-alive",
-            })
             r = None
             for _attempt in range(3):
                 try:
@@ -4860,62 +4936,88 @@ def search_datos_madrid(date_from, date_to, global_seen):
         ("oficinas",                 "actiu+mep"),
     ]
 
+    # Pagination: the API caps each response at PAGE_SIZE records. Page 1 tells
+    # us the total; the remaining pages are fetched concurrently (thread-local
+    # sessions) so N pages cost ~1 round-trip instead of N.
+    PAGE_SIZE = 100
+    MAX_PAGES = 10   # per keyword — 1,000 matches is far beyond a normal window
+
     # Date filter: only licences from our date window
     df_s = date_from.strftime("%Y-%m-%d")
     dt_s = date_to.strftime("%Y-%m-%d")
 
+    def _fetch_page(kw, offset, thread_local=False):
+        """Returns the datastore 'result' dict for one page, or None on failure."""
+        params = {
+            "resource_id": RESOURCE_ID,
+            "q": kw,
+            "limit": PAGE_SIZE,
+            "offset": offset,
+        }
+        # URL-encode parameters manually
+        param_str = "&".join(f"{k}={quote(str(v))}" for k, v in params.items())
+        url = f"{DATOS_API}?{param_str}"
+
+        r = safe_get(url, timeout=20, thread_local=thread_local)
+        if not r or r.status_code != 200:
+            log(f"  ⚠️ datos.madrid [{kw}] offset {offset}: HTTP {r.status_code if r else 'timeout'}")
+            return None
+
+        try:
+            data = orjson.loads(r.content)
+        except Exception:
+            return None
+
+        if not data.get("success"):
+            return None
+        return data.get("result", {})
+
+    from dateutil import parser as dp
+    d_from, d_to  = date_from.date(), date_to.date()
+    _DEAD_RESULTS = {"inadmitida", "desistida", "caducada", "denegada"}
+
     results = []
     seen_exp = set()
 
     for kw, _profile_hint in DATOS_KEYWORDS:
         if not time_ok(need_s=30): break
         try:
-            params = {
-                "resource_id": RESOURCE_ID,
-                "q": kw,
-                "limit": 100,
-                "offset": 0,
-            }
-            # URL-encode parameters manually
-            param_str = "&".join(f"{k}={quote(str(v))}" for k, v in params.items())
-            url = f"{DATOS_API}?{param_str}"
-
-            r = safe_get(url, timeout=20)
-            if not r or r.status_code != 200:
-                log(f"  ⚠️ datos.madrid [{kw}]: HTTP {r.status_code if r else 'timeout'}")
+            first = _fetch_page(kw, 0)
+            if first is None:
                 continue
 
-            try:
-                data = r.json()
-            except Exception:
-                continue
-
-            if not data.get("success"):
-                continue
-
-            records = data.get("result", {}).get("records", [])
-
+            records = list(first.get("records", []))
+            total   = int(first.get("total", 0) or 0)
+            offsets = list(range(PAGE_SIZE, min(total, PAGE_SIZE * MAX_PAGES), PAGE_SIZE))
+            if offsets:
+                with ThreadPoolExecutor(max_workers=min(N_WORKERS, len(offsets))) as executor:
+                    # map() keeps page order, so records stay in API order
+                    for page in executor.map(lambda o: _fetch_page(kw, o, thread_local=True), offsets):
+                        if page:
+                            records.extend(page.get("records", []))
+
+            # Filters run cheapest-first so rejected records never pay for the
+            # date parse or the KEYWORDS_EXCLUDE scan.
             for rec in records:
                 exp = str(rec.get("EXPEDIENTE", "")).strip()
                 if not exp or exp in seen_exp:
                     continue
 
+                # Only "Otorgada" or "En tramitación" results
+                resultado = str(rec.get("RESULTADO", "")).strip().lower()
+                if resultado in _DEAD_RESULTS:
+                    continue
+
                 # Date filter
                 fecha = str(rec.get("FECHA_OTORGAMIENTO", "") or "").strip()
                 if fecha:
                     try:
-                        from dateutil import parser as dp
                         rec_date = dp.parse(fecha[:10]).date()
-                        if rec_date < date_from.date() or rec_date > date_to.date():
+                        if rec_date < d_from or rec_date > d_to:
                             continue
                     except Exception:
                         pass  # keep if date parse fails
 
-                # Only "Otorgada" or "En tramitación" results
-                resultado = str(rec.get("RESULTADO", "")).strip().lower()
-                if resultado in ("inadmitida", "desistida", "caducada", "denegada"):
-                    continue
-
                 # Skip noise: small repairs, paint jobs, minor works
                 obj = str(rec.get("OBJETO", "") or "").lower()
                 desc_lower = str(rec.get("DESCRIPCION", "") or "").lower()